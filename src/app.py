@@ -1,18 +1,68 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, session, abort
 from simulation import HeatMapSolver
 import numpy as np
 import os
 import json
+import zlib
+import uuid
+import threading
+from collections import OrderedDict
+
+try:
+    import msgpack  # Optional: pip install msgpack (accept application/msgpack requests)
+except ImportError:
+    msgpack = None
+
+try:
+    import blosc2  # Optional: pip install blosc2 (grid compression for clients that accept it)
+except ImportError:
+    blosc2 = None
+
+try:
+    import orjson  # Optional: pip install orjson (faster JSON request parsing)
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
+# Signs the session cookie that identifies each client's simulation
+app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
 
 # === GLOBAL STATE ===
 # We store the simulation state in memory to avoid sending 
 # the entire grid back and forth over the network.
-SIMULATION_STATE = {
-    "grid": None,
-    "solver": HeatMapSolver()
-}
+# Each client gets its own grid and solver, so tabs don't collide.
+MAX_SESSIONS = 16
+MAX_CLIENT_ID_LENGTH = 64
+SIMULATION_SESSIONS = OrderedDict()
+# Flask serves requests on several threads; guards SIMULATION_SESSIONS
+SESSIONS_LOCK = threading.Lock()
+
+def get_session_state(client_id=None):
+    """
+    Returns the simulation state of the current client, creating it if needed.
+    Clients are keyed by the per-tab `client_id` they send, falling back to a
+    session cookie. The least recently used state is dropped once MAX_SESSIONS
+    is exceeded. A `client_id` that is not a short string gets a 400.
+    """
+    if client_id is not None and (not isinstance(client_id, str)
+                                  or len(client_id) > MAX_CLIENT_ID_LENGTH):
+        abort(400, description=f'client_id must be a string of at most {MAX_CLIENT_ID_LENGTH} characters.')
+
+    with SESSIONS_LOCK:
+        session_id = client_id or session.get('simulation_id')
+        if session_id not in SIMULATION_SESSIONS:
+            if session_id is None:
+                session_id = uuid.uuid4().hex
+                session['simulation_id'] = session_id
+            SIMULATION_SESSIONS[session_id] = {
+                "grid": None,
+                "solver": HeatMapSolver()
+            }
+            if len(SIMULATION_SESSIONS) > MAX_SESSIONS:
+                SIMULATION_SESSIONS.popitem(last=False)
+        else:
+            SIMULATION_SESSIONS.move_to_end(session_id)
+        return SIMULATION_SESSIONS[session_id]
 
 @app.route('/')
 def index():
@@ -36,6 +86,85 @@ def get_geometry(filename):
     with open(file_path, 'r') as f:
         return jsonify(json.load(f))
 
+def parse_request_body():
+    """
+    Decodes the request body as msgpack (Content-Type: application/msgpack)
+    or JSON, using the fastest decoder that is installed.
+    Malformed bodies, or bodies that are not a map, get a 400; unsupported
+    content types a 415.
+    """
+    if request.mimetype == 'application/msgpack':
+        if msgpack is None:
+            abort(415, description='msgpack request bodies require the msgpack package.')
+        try:
+            data = msgpack.unpackb(request.get_data(), raw=False)
+        except ValueError:
+            abort(400, description='Malformed msgpack body.')
+    elif orjson is not None and request.is_json:
+        try:
+            data = orjson.loads(request.get_data())
+        except orjson.JSONDecodeError:
+            abort(400, description='Malformed JSON body.')
+    else:
+        data = request.json
+    if not isinstance(data, dict):
+        abort(400, description='Request body must be a map.')
+    return data
+
+def accepts_encoding(encoding, explicit=False):
+    """
+    True if the client's Accept-Encoding header allows `encoding` (quality above zero).
+    With `explicit`, a `*` wildcard is not enough: the encoding must be named.
+    """
+    if explicit and encoding not in request.accept_encodings.values():
+        return False
+    return request.accept_encodings[encoding] > 0
+
+STREAM_CHUNK_BYTES = 1 << 16
+
+def iter_chunks(buffer):
+    """Yields a byte buffer as bytes chunks (WSGI servers only accept bytes)."""
+    for start in range(0, len(buffer), STREAM_CHUNK_BYTES):
+        yield bytes(buffer[start:start + STREAM_CHUNK_BYTES])
+
+def iter_gzip(buffer):
+    """Gzips a byte buffer chunk by chunk, yielding compressed output as it is produced."""
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for start in range(0, len(buffer), STREAM_CHUNK_BYTES):
+        yield compressor.compress(buffer[start:start + STREAM_CHUNK_BYTES])
+    yield compressor.flush()
+
+def quantize_grid(grid, lo, hi):
+    """
+    Affine-maps temperatures in [lo, hi] onto the full uint16 range.
+    The client recovers them as lo + q * (hi - lo) / 65535.
+    """
+    scale = 65535.0 / (hi - lo) if hi > lo else 0.0
+    scaled = (grid - lo) * scale
+    np.clip(scaled, 0, 65535, out=scaled)
+    return np.rint(scaled, out=scaled).astype(np.uint16)
+
+def encode_grid(grid):
+    """
+    Builds the response body for the quantized grid without first copying it into
+    one big bytes object.
+    Smooth heat fields compress well: Blosc2/LZ4 (byte-shuffled) is used for
+    clients that ask for it, otherwise fast gzip (streamed), which browsers decode
+    natively. Uncompressed, the grid's own buffer is streamed in chunks.
+    Returns (body_chunks, content_encoding, content_length); content_encoding is
+    None if uncompressed and content_length is None if not known up front.
+    """
+    # Blosc2 is not a standard HTTP coding, so only send it when asked for by name
+    if blosc2 is not None and accepts_encoding('blosc2', explicit=True):
+        payload = blosc2.compress2(grid, typesize=grid.itemsize,
+                                   codec=blosc2.Codec.LZ4, clevel=3)
+        return [payload], 'blosc2', len(payload)
+    # Zero-copy byte view of the (C-contiguous) grid
+    buffer = memoryview(grid).cast('B')
+    if accepts_encoding('gzip'):
+        return iter_gzip(buffer), 'gzip', None
+    return iter_chunks(buffer), None, grid.nbytes
+
 @app.route('/simulate', methods=['POST'])
 def simulate():
     """
@@ -44,13 +173,14 @@ def simulate():
     - If 'reset' is True: Re-initializes the grid.
     - Otherwise: Continues the simulation from the last saved state in memory.
     """
-    data = request.json
+    data = parse_request_body()
     geometry = data.get('geometry')
     should_reset = data.get('reset', False)
     
-    # Access the global state
-    current_grid = SIMULATION_STATE["grid"]
-    solver = SIMULATION_STATE["solver"]
+    # Access this session's state
+    state = get_session_state(data.get('client_id'))
+    current_grid = state["grid"]
+    solver = state["solver"]
     
     # Logic to decide if we need to start from scratch
     # We reset if:
@@ -59,18 +189,28 @@ def simulate():
     if should_reset or current_grid is None:
         # Passing None as current_grid tells the solver to create a new one
         new_grid = solver.solve_step(geometry, None)
-        SIMULATION_STATE["grid"] = new_grid
+        state["grid"] = new_grid
     else:
         # Continue simulation using the existing grid from memory
         new_grid = solver.solve_step(geometry, current_grid)
-        SIMULATION_STATE["grid"] = new_grid
+        state["grid"] = new_grid
     
-    # Return the grid to the client for visualization
-    # Note: Ideally, we would compress this or send binary data for even better performance,
-    # but removing the *upload* of the grid is the biggest bottleneck fix.
-    return jsonify({
-        'grid': new_grid.tolist()
-    })
+    # Return the grid to the client for visualization as a (compressed) raw
+    # uint16 buffer (row-major), quantized over the solver's temperature range.
+    # This skips building rows*cols Python floats for JSON, and halves the bytes of float32.
+    rows, cols = new_grid.shape
+    lo, hi = solver.temperature_range()
+    body, content_encoding, content_length = encode_grid(quantize_grid(new_grid, lo, hi))
+    resp = Response(body, mimetype='application/octet-stream', direct_passthrough=True)
+    resp.headers['X-Shape'] = f'{rows},{cols}'
+    resp.headers['X-Temperature-Range'] = f'{lo},{hi}'
+    if content_encoding is not None:
+        resp.headers['Content-Encoding'] = content_encoding
+    # The body differs by Accept-Encoding; caches must not share it across clients
+    resp.vary.add('Accept-Encoding')
+    if content_length is not None:
+        resp.headers['Content-Length'] = str(content_length)
+    return resp
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -1,8 +1,161 @@
+import threading
 import numpy as np
-import cv2  # Requires: pip install opencv-python
 from utils import load_config
-import hashlib
-import json
+
+try:
+    import cv2  # Optional: pip install opencv-python (fast polygon rasterization)
+except ImportError:
+    cv2 = None
+
+try:
+    from numba import njit, prange  # Optional: pip install numba (fused stencil kernel)
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import xxhash  # Optional: pip install xxhash (faster geometry hashing)
+except ImportError:
+    xxhash = None
+
+# Grid storage precision: float32 halves the memory traffic of the (memory-bound) stencil
+GRID_DTYPE = np.float32
+
+# Serializes calls into the parallel Numba kernel. Flask serves requests on
+# several threads, and Numba's portable `workqueue` threading layer (the one
+# available without TBB/OpenMP) aborts the process on concurrent parallel launches.
+_FDM_LOCK = threading.Lock()
+
+if NUMBA_AVAILABLE:
+    @njit("void(float32[:, :], boolean[:, :], float32, float32, float32[:, :])",
+          parallel=True, fastmath=True, cache=True)
+    def _fdm_step(u, mask, coeff, buoyancy, out):
+        """
+        Fused FDM update: diffusion + convection + Neumann walls in a single sweep.
+        Reads each neighbour straight from `u` and writes `out` once per cell,
+        instead of materialising shifted copies of the grid.
+        """
+        rows, cols = u.shape
+        for i in prange(rows):
+            for j in range(cols):
+                center = u[i, j]
+                # Cells outside the room are left untouched
+                if not mask[i, j]:
+                    out[i, j] = center
+                    continue
+
+                # NEUMANN BOUNDARY CONDITIONS (Insulation):
+                # a wall neighbour contributes zero gradient (no heat flow into the wall)
+                lap = 0.0
+                down = 0.0
+                if i + 1 < rows and mask[i + 1, j]:
+                    lap += u[i + 1, j] - center
+                if i > 0 and mask[i - 1, j]:
+                    down = u[i - 1, j] - center
+                if j + 1 < cols and mask[i, j + 1]:
+                    lap += u[i, j + 1] - center
+                if j > 0 and mask[i, j - 1]:
+                    lap += u[i, j - 1] - center
+
+                # Diffusion (alpha*dt/dx^2 * laplacian) + Convection (wind coming from below)
+                out[i, j] = center + coeff * (lap + down) + buoyancy * down
+
+
+# === GPU backend (optional, CuPy) ===
+# Same update as `_fdm_step`, one thread per cell
+_CUDA_FDM_SOURCE = r'''
+extern "C" __global__
+void fdm_step(const float* u, const bool* mask, const float coeff, const float buoyancy,
+              float* out, const int rows, const int cols)
+{
+    const int j = blockIdx.x * blockDim.x + threadIdx.x;
+    const int i = blockIdx.y * blockDim.y + threadIdx.y;
+    if (i >= rows || j >= cols) return;
+
+    const int idx = i * cols + j;
+    const float center = u[idx];
+    if (!mask[idx]) { out[idx] = center; return; }
+
+    float lap = 0.0f;
+    float down = 0.0f;
+    if (i + 1 < rows && mask[idx + cols]) lap += u[idx + cols] - center;
+    if (i > 0 && mask[idx - cols]) down = u[idx - cols] - center;
+    if (j + 1 < cols && mask[idx + 1]) lap += u[idx + 1] - center;
+    if (j > 0 && mask[idx - 1]) lap += u[idx - 1] - center;
+
+    out[idx] = center + coeff * (lap + down) + buoyancy * down;
+}
+'''
+_CUDA_BLOCK = (16, 16)
+
+_cupy = None
+_cuda_fdm_kernel = None
+
+
+def _load_cupy():
+    """
+    Lazily imports CuPy (pip install cupy-cuda12x).
+    Returns the module, or None if CuPy or a CUDA device is not available.
+    """
+    global _cupy
+    if _cupy is None:
+        try:
+            import cupy
+            _cupy = cupy if cupy.cuda.runtime.getDeviceCount() > 0 else False
+        except (ImportError, RuntimeError):
+            _cupy = False
+    return _cupy or None
+
+
+def _get_cuda_fdm_kernel():
+    """Compiles the CUDA stencil kernel on first use."""
+    global _cuda_fdm_kernel
+    if _cuda_fdm_kernel is None:
+        _cuda_fdm_kernel = _load_cupy().RawKernel(_CUDA_FDM_SOURCE, 'fdm_step')
+    return _cuda_fdm_kernel
+
+
+def _neighbour_diff(u, mask, axis, offset, out):
+    """
+    Writes (u[neighbour] - u) into `out` for the neighbour at `offset` (+1/-1) along `axis`.
+    NEUMANN BOUNDARY CONDITIONS (Insulation): the difference is zero where the
+    neighbour is a wall or off the grid (no heat flow into the wall).
+    """
+    if offset > 0:
+        src, dst, edge = slice(1, None), slice(None, -1), slice(-1, None)
+    else:
+        src, dst, edge = slice(None, -1), slice(1, None), slice(0, 1)
+
+    def along(s):
+        return (s, slice(None)) if axis == 0 else (slice(None), s)
+
+    out[along(edge)] = 0
+    np.subtract(u[along(src)], u[along(dst)], out=out[along(dst)])
+    out[along(dst)] *= mask[along(src)]
+
+
+def _fdm_step_numpy(u, mask, coeff, buoyancy, out, tmp):
+    """
+    NumPy fallback for `_fdm_step` when Numba is not installed.
+    Works on shifted slices written into the preallocated `out`/`tmp` buffers,
+    so no full-grid temporaries are created.
+    """
+    # Diffusion from the neighbours above, right and left
+    _neighbour_diff(u, mask, 0, 1, out)
+    _neighbour_diff(u, mask, 1, 1, tmp)
+    out += tmp
+    _neighbour_diff(u, mask, 1, -1, tmp)
+    out += tmp
+    out *= coeff
+
+    # The neighbour below feeds both diffusion and convection (wind coming from below)
+    _neighbour_diff(u, mask, 0, -1, tmp)
+    tmp *= coeff + buoyancy
+    out += tmp
+
+    # Only update the interior of the room
+    out *= mask
+    out += u
 
 class HeatMapSolver:
     def __init__(self, config_path='../config.json'):
@@ -10,6 +163,8 @@ class HeatMapSolver:
         self.grid_resolution = self.config['simulation_settings']['grid_resolution_meters']
         self.physics = self.config['physics_constants']
         self.heat_sources = self.config['heat_sources']
+        # Grids with at least this many cells run on the GPU (if CuPy is available)
+        self.gpu_min_cells = self.config['simulation_settings'].get('gpu_min_cells', 256 * 256)
 
         # === 1. Caching Variables ===
         # Store the last calculated mask to avoid re-computing it every step
@@ -17,6 +172,21 @@ class HeatMapSolver:
         self._last_geometry_hash = None
         self._cached_grid_shape = None
 
+        # Ping-pong grid buffers, reused across steps while the grid shape is unchanged
+        self._u = None
+        self._out = None
+        self._tmp = None  # Scratch buffer for the NumPy stencil fallback
+
+        # Grid cells covered by each heat source, rebuilt when the grid shape changes
+        self._source_indices = None
+
+        # Device-resident copies for the GPU backend
+        self._u_gpu = None
+        self._out_gpu = None
+        self._mask_gpu = None
+        self._source_indices_gpu = None
+        self._gpu_mask_source = None  # Host mask the device copies were built from
+
         # === 3. Stability Check (CFL Condition) ===
         self._validate_stability()
 
@@ -38,72 +208,105 @@ class HeatMapSolver:
                 f"Maximum allowed dt is {limit:.6f} seconds."
             )
 
-    def _get_geometry_hash(self, geometry):
-        """Generates a unique hash for the geometry to detect changes."""
-        # JSON string dump is an easy way to hash nested lists
-        s = json.dumps(geometry, sort_keys=True)
-        return hashlib.md5(s.encode('utf-8')).hexdigest()
+    def temperature_range(self):
+        """
+        Returns (min, max) temperature the simulation can reach.
+        Diffusion never leaves the range spanned by the walls, the initial room
+        temperature and the heat sources.
+        """
+        temps = [self.physics['wall_temp'], self.physics['initial_room_temp']]
+        temps += [source['temperature'] for source in self.heat_sources]
+        return min(temps), max(temps)
 
-    def _rasterize_geometry(self, geometry, grid_shape):
+    def _to_pixels(self, geometry):
+        """
+        Snaps geometry vertices (meters) to integer grid-cell coordinates,
+        truncating the same way OpenCV's rasterization expects.
+        Returns a C-contiguous (N, 2) int32 array.
+        """
+        return (np.asarray(geometry, dtype=np.float64) / self.grid_resolution).astype(np.int32)
+
+    def _get_geometry_hash(self, pts_px):
+        """
+        Generates a hash for the geometry to detect changes.
+        Hashes the pixel-snapped vertices, so sub-cell jitter (e.g. moving a
+        vertex by 1 cm) keeps the cached mask.
+        """
+        # Hash the raw coordinate bytes (plus shape) instead of serializing to a string
+        arr = np.ascontiguousarray(pts_px)
+        if xxhash is not None:
+            return (arr.shape, xxhash.xxh3_64_intdigest(arr.tobytes()))
+        return (arr.shape, hash(arr.tobytes()))
+
+    def _rasterize_geometry(self, pts_px, grid_shape):
         """
         === 2. Optimization using OpenCV ===
         Uses OpenCV to rapidly draw the polygon instead of slow Python loops.
+        `pts_px` is an (N, 2) int32 array of vertices in grid cells (see `_to_pixels`).
         """
+        if cv2 is None:
+            return self._rasterize_geometry_numpy(pts_px, grid_shape)
+        
         rows, cols = grid_shape
         
-        # Convert coordinates from meters (Float) to pixels (Integer)
-        # OpenCV expects an array of points (x, y) of type int32
-        pts_float = np.array(geometry) / self.grid_resolution
-        pts_int = pts_float.astype(np.int32)
+        # OpenCV expects an array of points (x, y) of type int32, shaped (N, 1, 2)
+        pts_int = pts_px.reshape(-1, 1, 2)
         
         # Create a black image
         mask_img = np.zeros((rows, cols), dtype=np.uint8)
         
         # fillPoly fills the polygon with value 1 (white)
         # The function expects a list of polygons, so we wrap in []
-        pts_reshaped = pts_int.reshape((-1, 1, 2))
-        cv2.fillPoly(mask_img, [pts_reshaped], 1)
+        cv2.fillPoly(mask_img, [pts_int], 1)
         
-        # Convert to boolean mask
-        return mask_img.astype(bool)
+        # Reinterpret as a boolean mask (0/1 bytes) without copying
+        return mask_img.view(bool)
 
-    def solve_step(self, geometry, current_grid=None):
+    def _rasterize_geometry_numpy(self, pts_px, grid_shape):
         """
-        Performs a single simulation step.
+        Pure NumPy fallback for `_rasterize_geometry` when OpenCV is not installed.
+        Mirrors cv2.fillPoly on the same pixel-snapped vertices: the polygon
+        outline is drawn as part of the room. The interior uses even-odd ray
+        casting from every pixel, vectorized over the whole grid: the only
+        Python loop is over the edges. Axis-aligned walls match OpenCV exactly;
+        slanted walls may differ by a pixel where OpenCV rounds its lines differently.
         """
-        # Calculate desired grid size based on geometry
-        poly = np.array(geometry)
-        max_x = np.max(poly[:, 0])
-        max_y = np.max(poly[:, 1])
+        rows, cols = grid_shape
         
-        # Add small padding
-        width_meters = max_x + 1.0
-        height_meters = max_y + 1.0
+        # Widen to int64 so the edge arithmetic below cannot overflow
+        pts_int = pts_px.astype(np.int64)
         
-        cols = int(np.ceil(width_meters / self.grid_resolution))
-        rows = int(np.ceil(height_meters / self.grid_resolution))
+        # Pixel coordinates, shaped to broadcast to (rows, cols)
+        ys = np.arange(rows)[:, None]
+        xs = np.arange(cols)[None, :]
         
-        # === Check if Cache should be used ===
-        geo_hash = self._get_geometry_hash(geometry)
-        
-        # If we have a saved mask, and geometry/size haven't changed - use it
-        if (self._cached_mask is not None and 
-            self._last_geometry_hash == geo_hash and 
-            self._cached_grid_shape == (rows, cols)):
-            mask = self._cached_mask
-        else:
-            # Otherwise, recalculate and save
-            mask = self._rasterize_geometry(geometry, (rows, cols))
-            self._cached_mask = mask
-            self._last_geometry_hash = geo_hash
-            self._cached_grid_shape = (rows, cols)
+        inside = np.zeros((rows, cols), dtype=bool)
+        outline = np.zeros((rows, cols), dtype=bool)
+        for (x1, y1), (x2, y2) in zip(pts_int, np.roll(pts_int, -1, axis=0)):
+            # A horizontal ray never crosses a horizontal edge
+            if y1 != y2:
+                # Rows whose line crosses this edge, and where along x it is crossed
+                crosses = (y1 > ys) != (y2 > ys)
+                x_intersect = (x2 - x1) * (ys - y1) / (y2 - y1) + x1
+                # Each crossing to the right of the pixel toggles inside/outside
+                inside ^= crosses & (xs < x_intersect)
+            
+            # Pixels on the edge line count as inside (one pixel per step along the longer axis)
+            n_steps = max(abs(x2 - x1), abs(y2 - y1), 1)
+            t = np.arange(n_steps + 1)
+            line_x = x1 + np.floor(t * (x2 - x1) / n_steps + 0.5).astype(np.int64)
+            line_y = y1 + np.floor(t * (y2 - y1) / n_steps + 0.5).astype(np.int64)
+            on_grid = (line_x >= 0) & (line_x < cols) & (line_y >= 0) & (line_y < rows)
+            outline[line_y[on_grid], line_x[on_grid]] = True
+        return inside | outline
 
-        # Initialize Grid (if this is the first step)
-        if current_grid is None or current_grid.shape != (rows, cols):
-            current_grid = np.full((rows, cols), self.physics['wall_temp'])
-            current_grid[mask] = self.physics['initial_room_temp']
-        
-        # Apply Heat Sources
+    def _compute_source_indices(self, grid_shape):
+        """
+        Finds the grid cells inside each circular heat source.
+        Returns a list of (row_indices, col_indices, temperature) tuples.
+        """
+        rows, cols = grid_shape
+        source_indices = []
         for source in self.heat_sources:
             sx, sy = source['x'], source['y']
             sr = source['radius']
@@ -121,52 +324,137 @@ class HeatMapSolver:
             x_coords = x_indices * self.grid_resolution + self.grid_resolution/2
             
             dist_sq = (x_coords - sx)**2 + (y_coords - sy)**2
-            source_mask = dist_sq <= sr**2
+            ys, xs = np.nonzero(dist_sq <= sr**2)
+            
+            # Shift local bounding-box indices back to full-grid indices
+            source_indices.append((ys + r_start, xs + c_start, temp))
+        return source_indices
+
+    def _solve_step_gpu(self, mask, host_updated, coeff, buoyancy):
+        """
+        Performs the physics step on the GPU.
+        The grid stays resident on the device between steps: it is uploaded only
+        when the host grid was (re)initialized, and downloaded once per call into
+        the reused host buffer.
+        """
+        cp = _load_cupy()
+        rows, cols = self._u.shape
+        
+        if self._u_gpu is None or self._u_gpu.shape != (rows, cols):
+            self._u_gpu = cp.empty((rows, cols), dtype=GRID_DTYPE)
+            self._out_gpu = cp.empty((rows, cols), dtype=GRID_DTYPE)
+            host_updated = True
+        if host_updated:
+            self._u_gpu.set(self._u)
+        
+        # Mask and heat source indices only change together with the geometry
+        if self._gpu_mask_source is not mask:
+            self._mask_gpu = cp.asarray(mask)
+            self._source_indices_gpu = [(cp.asarray(src_rows), cp.asarray(src_cols), temp)
+                                        for src_rows, src_cols, temp in self._source_indices]
+            self._gpu_mask_source = mask
+        
+        # Apply Heat Sources
+        for src_rows, src_cols, temp in self._source_indices_gpu:
+            self._u_gpu[src_rows, src_cols] = temp
+        
+        grid = ((cols + _CUDA_BLOCK[0] - 1) // _CUDA_BLOCK[0],
+                (rows + _CUDA_BLOCK[1] - 1) // _CUDA_BLOCK[1])
+        _get_cuda_fdm_kernel()(grid, _CUDA_BLOCK, (
+            self._u_gpu, self._mask_gpu, GRID_DTYPE(coeff), GRID_DTYPE(buoyancy),
+            self._out_gpu, np.int32(rows), np.int32(cols)))
+        
+        # Swap device buffers, then copy the result back once
+        self._u_gpu, self._out_gpu = self._out_gpu, self._u_gpu
+        self._u_gpu.get(out=self._u)
+        
+        return self._u
+
+    def solve_step(self, geometry, current_grid=None):
+        """
+        Performs a single simulation step.
+        The returned grid is an internal buffer that is reused by later steps.
+        """
+        # Snap the geometry to grid cells once; the hash, grid size and mask are all
+        # derived from these pixel coordinates, so cached results depend only on the key
+        pts_px = self._to_pixels(geometry)
+        
+        # Fingerprint the geometry first so cached work can be reused
+        geo_hash = self._get_geometry_hash(pts_px)
+        
+        # === Check if Cache should be used ===
+        # Grid size and mask depend only on the geometry: recompute them only when it changes
+        if self._cached_mask is None or self._last_geometry_hash != geo_hash:
+            # Calculate desired grid size based on geometry
+            max_x, max_y = pts_px.max(axis=0)
             
-            # Update only in the relevant area
-            current_grid[r_start:r_end, c_start:c_end][source_mask] = temp
+            # Add small padding (1 meter)
+            padding_cells = int(np.ceil(1.0 / self.grid_resolution))
+            
+            cols = int(max_x) + padding_cells
+            rows = int(max_y) + padding_cells
+            
+            self._cached_mask = self._rasterize_geometry(pts_px, (rows, cols))
+            self._last_geometry_hash = geo_hash
+            self._cached_grid_shape = (rows, cols)
+        
+        mask = self._cached_mask
+        rows, cols = self._cached_grid_shape
+
+        # Allocate the grid buffers only when the grid size changes
+        if self._u is None or self._u.shape != (rows, cols):
+            self._u = np.empty((rows, cols), dtype=GRID_DTYPE)
+            self._out = np.empty((rows, cols), dtype=GRID_DTYPE)
+            if not NUMBA_AVAILABLE:
+                self._tmp = np.empty((rows, cols), dtype=GRID_DTYPE)
+            self._source_indices = None
+
+        # Initialize Grid (if this is the first step)
+        host_updated = True
+        if current_grid is None or current_grid.shape != (rows, cols):
+            self._u.fill(self.physics['wall_temp'])
+            self._u[mask] = self.physics['initial_room_temp']
+        elif current_grid is not self._u:
+            # Grid handed in from outside (not our last result) - adopt its values
+            np.copyto(self._u, current_grid)
+        else:
+            host_updated = False
+        current_grid = self._u
+        
+        # Heat source cell indices are precomputed per grid shape
+        if self._source_indices is None:
+            self._source_indices = self._compute_source_indices((rows, cols))
 
         # === PHYSICS UPDATE ===
         alpha = self.physics['thermal_diffusivity']
         dt = self.config['simulation_settings']['time_step_seconds']
         dx = self.grid_resolution
         
-        u = current_grid
+        # Diffusion coefficient of the 5-point stencil
+        coeff = alpha * dt / (dx ** 2)
         
-        # 1. Create neighbor shifts
-        u_up = np.roll(u, -1, axis=0)
-        u_down = np.roll(u, 1, axis=0)
-        u_left = np.roll(u, -1, axis=1)
-        u_right = np.roll(u, 1, axis=1)
-        
-        # 2. NEUMANN BOUNDARY CONDITIONS (Insulation)
-        # Shift the mask to find where the walls are relative to each pixel
-        mask_up = np.roll(mask, -1, axis=0)
-        mask_down = np.roll(mask, 1, axis=0)
-        mask_left = np.roll(mask, -1, axis=1)
-        mask_right = np.roll(mask, 1, axis=1)
-        
-        # If a neighbor is a wall (False in mask), use the current cell's temp
-        # This makes the gradient 0 (no heat flow into the wall)
-        u_up = np.where(mask_up, u_up, u)
-        u_down = np.where(mask_down, u_down, u)
-        u_left = np.where(mask_left, u_left, u)
-        u_right = np.where(mask_right, u_right, u)
-        
-        # 3. CONVECTION (Heat Rises)
+        # CONVECTION (Heat Rises)
         # Simple advection: shift heat from bottom to top
         # buoyant_velocity * (dT/dy)
         buoyancy_factor = 0.5 * dt # Adjustable parameter
-        advection = (u - u_down)   # Wind coming from below
         
-        # 4. Final Calculation
-        laplacian = (u_up + u_down + u_left + u_right - 4*u) / (dx**2)
+        # Large grids run on the GPU when one is available
+        if rows * cols >= self.gpu_min_cells and _load_cupy() is not None:
+            return self._solve_step_gpu(mask, host_updated, coeff, buoyancy_factor)
         
-        # Update: Diffusion + Convection
-        change = (alpha * dt * laplacian) - (buoyancy_factor * advection)
+        # Apply Heat Sources
+        for src_rows, src_cols, temp in self._source_indices:
+            current_grid[src_rows, src_cols] = temp
+        
+        u = current_grid
+        
+        if NUMBA_AVAILABLE:
+            with _FDM_LOCK:
+                _fdm_step(u, mask, coeff, buoyancy_factor, self._out)
+        else:
+            _fdm_step_numpy(u, mask, coeff, buoyancy_factor, self._out, self._tmp)
         
-        new_grid = u.copy()
-        # Only update the interior of the room
-        new_grid[mask] += change[mask]
+        # Swap buffers: the result becomes the input of the next step
+        self._u, self._out = self._out, self._u
         
-        return new_grid
\ No newline at end of file
+        return self._u
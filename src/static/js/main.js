@@ -15,6 +15,11 @@ let isPlaying = false;
 let showMesh = false;
 let animationId = null;
 
+// Identifies this tab's simulation state on the server.
+// crypto.getRandomValues (unlike crypto.randomUUID) also works over plain HTTP.
+const clientId = Array.from(crypto.getRandomValues(new Uint8Array(16)),
+    b => b.toString(16).padStart(2, '0')).join('');
+
 // === History Buffer ===
 let history = [];
 let currentFrameIndex = -1;
@@ -129,11 +134,15 @@ async function simulationLoop() {
             const response = await fetch('/simulate', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ geometry: geometryData, reset: shouldReset })
+                body: JSON.stringify({ geometry: geometryData, reset: shouldReset, client_id: clientId })
             });
-            const data = await response.json();
+            // Grid arrives as raw row-major uint16 bytes, quantized over the
+            // X-Temperature-Range header (lo,hi); shape in the X-Shape header
+            const [rows, cols] = response.headers.get('X-Shape').split(',').map(Number);
+            const [lo, hi] = response.headers.get('X-Temperature-Range').split(',').map(Number);
+            const values = new Uint16Array(await response.arrayBuffer());
 
-            history.push(data.grid);
+            history.push({ rows, cols, values, lo, step: (hi - lo) / 65535 });
             currentFrameIndex = history.length - 1;
             updateSliderUI();
         } catch (err) {
@@ -223,8 +232,7 @@ function renderHeatmap() {
         // 1. Draw Heatmap Content
         const gridState = history[currentFrameIndex];
         if (gridState) {
-            const rows = gridState.length;
-            const cols = gridState[0].length;
+            const { rows, cols, values, lo, step } = gridState;
 
             const offCanvas = document.createElement('canvas');
             offCanvas.width = cols; offCanvas.height = rows;
@@ -234,7 +242,7 @@ function renderHeatmap() {
 
             for (let r = 0; r < rows; r++) {
                 for (let c = 0; c < cols; c++) {
-                    const val = gridState[r][c];
+                    const val = lo + values[r * cols + c] * step;
                     const t = Math.min(Math.max(val / 100, 0), 1);
                     const [rVal, gVal, bVal] = getHeatColorRGB(t);
                     const index = (r * cols + c) * 4;
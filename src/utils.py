@@ -1,9 +1,13 @@
+import functools
 import json
 import os
 
+@functools.lru_cache(maxsize=8)
 def load_config(config_path='../config.json'):
     """
     Loads the configuration from a JSON file.
+    Results are cached per path, so repeated calls return the same dict
+    without touching the disk (treat it as read-only).
     
     Args:
         config_path (str): Path to the configuration file.